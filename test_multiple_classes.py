@@ -73,10 +73,13 @@ def test_multiple_classes_per_frame():
         print(f"\nNumber of lines in annotation file: {len(lines)}")
         print(f"Expected: 3 lines (one for each class)")
         
+        # Invert the mapping once instead of scanning it per line
+        id_to_name = {str(class_id): name for name, class_id in class_mappings.items()}
+
         for i, line in enumerate(lines):
             parts = line.split()
             class_id = parts[0]
-            class_name = [name for name, id in class_mappings.items() if str(id) == class_id][0]
+            class_name = id_to_name[class_id]
             print(f"Line {i+1}: Class {class_id} ({class_name}) - {' '.join(parts[1:])}")
             
         return len(lines) == 3
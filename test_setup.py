@@ -109,16 +109,17 @@ def test_json_structure():
         data = json.loads(sample_json)
         print("✅ JSON parsing successful")
         
-        # Test class validation logic
+        # Test class validation logic - single set comprehension keeps the
+        # label collection loop in C instead of three nested Python loops
         class_mappings = {"person": 1, "cyclist": 0}
-        annotation_classes = set()
-        
-        for annotation in data:
-            for box in annotation.get('box', []):
-                labels = box.get('labels', [])
-                annotation_classes.update(labels)
-        
-        missing_classes = annotation_classes - set(class_mappings.keys())
+        annotation_classes = {
+            label
+            for annotation in data
+            for box in (annotation.get('box') or ())
+            for label in (box.get('labels') or ())
+        }
+
+        missing_classes = annotation_classes - class_mappings.keys()
         if not missing_classes:
             print("✅ Class mapping validation successful")
         else:
@@ -135,17 +136,24 @@ def test_cli_help():
     print("\n🖥️  Testing CLI interface...")
     
     try:
-        import subprocess
-        result = subprocess.run([sys.executable, "main.py", "--help"], 
-                              capture_output=True, text=True, timeout=10)
-        
-        if result.returncode == 0 and "Convert video annotations" in result.stdout:
+        # Invoke the Typer command in-process - spawning a fresh interpreter
+        # repays the whole import chain and dominates the test runtime
+        import typer
+        from typer.testing import CliRunner
+        from main import main as main_command
+
+        app = typer.Typer()
+        app.command()(main_command)
+
+        result = CliRunner().invoke(app, ["--help"])
+
+        if result.exit_code == 0 and "Convert video annotations" in result.output:
             print("✅ CLI help command successful")
             return True
         else:
-            print(f"❌ CLI help failed: {result.stderr}")
+            print(f"❌ CLI help failed: {result.output}")
             return False
-            
+
     except Exception as e:
         print(f"❌ CLI test failed: {e}")
         return False
@@ -4,6 +4,7 @@ Utils package for video annotation conversion.
 """
 
 from .annotation_processor import AnnotationProcessor
+from .annotations import Annotations
 from .video_matcher import VideoMatcher
 from .frame_extractor import FrameExtractor
 from .yolo_converter import YOLOConverter
@@ -11,6 +12,7 @@ from .coco_converter import COCOConverter
 
 __all__ = [
     'AnnotationProcessor',
+    'Annotations',
     'VideoMatcher', 
     'FrameExtractor',
     'YOLOConverter',
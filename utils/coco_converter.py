@@ -2,13 +2,16 @@
 COCO format converter.
 """
 
-import json
+import numpy as np
+import orjson
 from pathlib import Path
 from typing import Dict, List, Tuple
 from datetime import datetime
 
 
 class COCOConverter:
+    INITIAL_ANNOTATION_CAPACITY = 1 << 16
+
     def __init__(self, class_mappings: Dict[str, int]):
         """
         Initialize COCO converter.
@@ -39,9 +42,32 @@ class COCOConverter:
         
         self.image_id = 1
         self.annotation_id = 1
-        
+
+        # Annotations are stored column-wise (structure-of-arrays): 100k+
+        # boxes as four NumPy arrays instead of 100k ~300-byte dicts. The
+        # dict entries are only materialized at save time.
+        self._ann_count = 0
+        capacity = self.INITIAL_ANNOTATION_CAPACITY
+        self._ann_bbox = np.empty((capacity, 4), dtype=np.float32)
+        self._ann_image_ids = np.empty(capacity, dtype=np.int64)
+        self._ann_category_ids = np.empty(capacity, dtype=np.int64)
+
         # Initialize categories
         self._create_categories()
+
+    def _ensure_annotation_capacity(self, extra: int):
+        """Grow the annotation arrays (doubling) to fit `extra` more rows."""
+        needed = self._ann_count + extra
+        capacity = len(self._ann_image_ids)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ('_ann_bbox', '_ann_image_ids', '_ann_category_ids'):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._ann_count] = old[:self._ann_count]
+            setattr(self, name, new)
     
     def _create_categories(self):
         """Create COCO categories from class mappings."""
@@ -78,7 +104,36 @@ class COCOConverter:
         height_pixels = max(1, min(img_height - y_pixels, height_pixels))
         
         return x_pixels, y_pixels, width_pixels, height_pixels
-    
+
+    def _convert_bboxes_to_coco_batch(self, xywh_percent: np.ndarray, img_wh: np.ndarray) -> np.ndarray:
+        """
+        Vectorized _convert_bbox_to_coco for all boxes of one image.
+
+        One NumPy pass replaces the per-box Python loop of scalar multiplies
+        and min/max calls. All math stays in float32: the 24-bit mantissa
+        comfortably covers percent inputs and pixel outputs, and the narrower
+        lanes double SIMD throughput over float64.
+
+        Args:
+            xywh_percent: (N, 4) array of boxes in percentage coordinates
+            img_wh: (2,) array of image (width, height) in pixels
+
+        Returns:
+            (N, 4) array of boxes in COCO pixel coordinates
+        """
+        # Fold the /100 into the per-axis scale: one multiply per element
+        scale = np.tile(img_wh, 2).astype(np.float32) * np.float32(0.01)
+        xywh = xywh_percent.astype(np.float32) * scale
+
+        # Same bounds as the scalar path: keep the origin inside the image
+        # and give every box at least a 1-pixel extent
+        xywh[:, 0] = np.clip(xywh[:, 0], 0, img_wh[0] - 1)
+        xywh[:, 1] = np.clip(xywh[:, 1], 0, img_wh[1] - 1)
+        xywh[:, 2] = np.clip(xywh[:, 2], 1, img_wh[0] - xywh[:, 0])
+        xywh[:, 3] = np.clip(xywh[:, 3], 1, img_wh[1] - xywh[:, 1])
+
+        return xywh
+
     def add_image_with_annotations(self, image_filename: str, image_shape: Tuple[int, int, int], 
                                   annotations: List[Dict]):
         """
@@ -89,8 +144,30 @@ class COCOConverter:
             image_shape: Shape of the image (height, width, channels)
             annotations: List of annotation dictionaries for the image
         """
+        class_ids = np.array([a['class_id'] for a in annotations], dtype=np.int64)
+        xywh_percent = np.array(
+            [[a['x'], a['y'], a['width'], a['height']] for a in annotations],
+            dtype=np.float32
+        ).reshape(-1, 4)
+        self.add_image_with_annotation_arrays(image_filename, image_shape, class_ids, xywh_percent)
+
+    def add_image_with_annotation_arrays(self, image_filename: str, image_shape: Tuple[int, int, int],
+                                         class_ids: np.ndarray, xywh_percent: np.ndarray):
+        """
+        Add an image and its annotations from structure-of-arrays box storage.
+
+        Array-native counterpart of add_image_with_annotations; the processor
+        stores boxes as (class_ids, xywh) arrays so this skips the per-box
+        dict round trip.
+
+        Args:
+            image_filename: Name of the image file
+            image_shape: Shape of the image (height, width, channels)
+            class_ids: (N,) array of class ids
+            xywh_percent: (N, 4) array of boxes in percentage coordinates
+        """
         img_height, img_width = image_shape[:2]
-        
+
         # Add image entry
         image_entry = {
             "id": self.image_id,
@@ -101,37 +178,46 @@ class COCOConverter:
             "date_captured": datetime.now().isoformat()
         }
         self.coco_data["images"].append(image_entry)
-        
-        # Add annotation entries
-        for annotation in annotations:
-            class_id = annotation['class_id']
-            x = annotation['x']
-            y = annotation['y']
-            width = annotation['width']
-            height = annotation['height']
-            
-            # Convert to COCO format
-            x_coco, y_coco, width_coco, height_coco = self._convert_bbox_to_coco(
-                x, y, width, height, img_width, img_height
-            )
-            
-            # Calculate area
-            area = width_coco * height_coco
-            
-            # Create annotation entry
-            annotation_entry = {
-                "id": self.annotation_id,
-                "image_id": self.image_id,
-                "category_id": class_id,
-                "bbox": [x_coco, y_coco, width_coco, height_coco],
-                "area": area,
+
+        # Add annotation entries into the columnar arrays, converting all
+        # boxes of this image in one vectorized shot
+        count = len(class_ids)
+        if count:
+            self._ensure_annotation_capacity(count)
+
+            img_wh = np.array([img_width, img_height], dtype=np.float32)
+            bboxes = self._convert_bboxes_to_coco_batch(xywh_percent, img_wh)
+
+            rows = slice(self._ann_count, self._ann_count + count)
+            self._ann_bbox[rows] = bboxes
+            self._ann_image_ids[rows] = self.image_id
+            self._ann_category_ids[rows] = class_ids
+            self._ann_count += count
+            self.annotation_id += count
+
+        self.image_id += 1
+
+    def annotation_entries(self) -> List[Dict]:
+        """
+        Materialize the columnar annotation storage as COCO dict entries.
+
+        Ids are assigned sequentially from 1 in insertion order.
+        """
+        bbox = self._ann_bbox[:self._ann_count]
+        areas = bbox[:, 2] * bbox[:, 3]
+
+        return [
+            {
+                "id": row + 1,
+                "image_id": int(self._ann_image_ids[row]),
+                "category_id": int(self._ann_category_ids[row]),
+                "bbox": [float(v) for v in bbox[row]],
+                "area": float(areas[row]),
                 "segmentation": [],  # Empty for bounding box only
                 "iscrowd": 0
             }
-            self.coco_data["annotations"].append(annotation_entry)
-            self.annotation_id += 1
-        
-        self.image_id += 1
+            for row in range(self._ann_count)
+        ]
     
     def save_coco_file(self, output_path: Path):
         """
@@ -140,7 +226,14 @@ class COCOConverter:
         Args:
             output_path: Path where to save the COCO JSON file
         """
-        with open(output_path, 'w') as f:
-            json.dump(self.coco_data, f, indent=2)
-        
-        print(f"📄 COCO file saved with {len(self.coco_data['images'])} images and {len(self.coco_data['annotations'])} annotations")
\ No newline at end of file
+        # Merge annotations materialized from columnar storage with any
+        # entries merged in externally (e.g. from per-video workers)
+        coco_data = dict(self.coco_data)
+        coco_data['annotations'] = self.coco_data['annotations'] + self.annotation_entries()
+
+        # orjson serializes several times faster than stdlib json and knows
+        # how to emit NumPy scalars directly
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(coco_data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+
+        print(f"📄 COCO file saved with {len(coco_data['images'])} images and {len(coco_data['annotations'])} annotations")
\ No newline at end of file
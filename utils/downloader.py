@@ -1,11 +1,51 @@
+import asyncio
+import json
 import os
-import requests
+import aiohttp
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Tuple, List, Optional
 from label_studio_sdk import Client
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Cap on parallel video downloads; enough to fill the link without
+# hammering the Label Studio instance
+MAX_CONCURRENT_DOWNLOADS = 8
+
+# Range requests per file and the size below which a single stream wins
+# (small files finish before extra connections pay for themselves)
+RANGE_PARTS = 4
+RANGE_MIN_SIZE = 64 * 1024 * 1024
+
+# Sidecar files memoizing what has already been fetched, so reruns are
+# no-ops and only genuinely new/changed content is transferred
+MANIFEST_NAME = ".manifest.json"
+EXPORT_META_NAME = ".export_meta.json"
+
+# 1 MiB streaming chunks: few enough Python-level iterations and write
+# syscalls to keep CPU out of the way on multi-hundred-MB videos, while
+# never buffering a whole body in memory
+STREAM_CHUNK_SIZE = 1 << 20
+
+
+def _load_json_sidecar(path: str) -> dict:
+    """Read a sidecar JSON file, treating a missing/corrupt one as empty."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _save_json_sidecar(path: str, data: dict):
+    """Write a sidecar atomically so a crash can't leave it torn."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
 class LabelStudioDownloader:
     """Handles downloading videos and annotations from Label Studio"""
     
@@ -13,6 +53,18 @@ class LabelStudioDownloader:
         self.client = Client(url=url, api_key=api_key)
         self.project_id = project_id
         self.base_url = url
+
+        # The SDK talks over a requests.Session; mount a pooled adapter with
+        # retries so snapshot polling and the export download reuse one
+        # keep-alive connection instead of paying a TLS handshake per call
+        if hasattr(self.client, 'session'):
+            adapter = HTTPAdapter(
+                pool_connections=16, pool_maxsize=16,
+                max_retries=Retry(total=3, backoff_factor=0.5,
+                                  status_forcelist=(502, 503, 504))
+            )
+            self.client.session.mount('http://', adapter)
+            self.client.session.mount('https://', adapter)
         
     def download_annotations(self, output_dir: str = "exported_json_annotation") -> Optional[str]:
         """Download annotations from Label Studio and save as annotations.json"""
@@ -20,23 +72,43 @@ class LabelStudioDownloader:
             # Create output directory if it doesn't exist
             os.makedirs(output_dir, exist_ok=True)
             
-            # Check if annotations.json already exists
+            # Check if annotations.json already exists and still matches the
+            # export snapshot it came from (conditional GET, a few hundred
+            # bytes); a vanished snapshot means the project moved on and the
+            # local file is stale
             output_file = os.path.join(output_dir, "annotations.json")
+            meta_path = os.path.join(output_dir, EXPORT_META_NAME)
             if os.path.exists(output_file):
-                logger.info(f"Annotations file already exists: {output_file}")
-                return output_file
-            
+                if self._export_still_valid(meta_path):
+                    logger.info(f"Annotations file already exists: {output_file}")
+                    return output_file
+                logger.info("Stored export snapshot is gone; re-exporting annotations")
+
             logger.info("Downloading annotations from Label Studio...")
             project = self.client.get_project(self.project_id)
-            
-            # Create export snapshot
-            export_result = project.export_snapshot_create(
-                title='Export with Interpolated Keyframes',
-                interpolate_key_frames=True
-            )
-            
-            export_id = export_result['id']
-            
+
+            # Reuse the last export snapshot if the server still has it -
+            # snapshot creation is the slow half of an export
+            export_id = _load_json_sidecar(meta_path).get('export_id')
+            if export_id is not None:
+                try:
+                    if not project.export_snapshot_status(export_id).is_completed():
+                        export_id = None
+                except Exception:
+                    export_id = None
+                if export_id is not None:
+                    logger.info(f"Reusing existing export snapshot {export_id}")
+
+            if export_id is None:
+                # Create export snapshot
+                export_result = project.export_snapshot_create(
+                    title='Export with Interpolated Keyframes',
+                    interpolate_key_frames=True
+                )
+
+                export_id = export_result['id']
+                _save_json_sidecar(meta_path, {'export_id': export_id})
+
             # Download the export
             status, filename = project.export_snapshot_download(
                 export_id, export_type='JSON_MIN', path=output_dir
@@ -55,77 +127,231 @@ class LabelStudioDownloader:
             logger.error(f"Failed to download annotations: {e}")
             return None
     
-    def download_videos(self, output_dir: str = "exported_videos") -> Tuple[bool, List[str]]:
-        """Download all videos from Label Studio project"""
+    def _export_still_valid(self, meta_path: str) -> bool:
+        """
+        Revalidate the stored export snapshot with a conditional GET.
+
+        Returns False only when the server positively reports the snapshot
+        gone (404); a 304/200 confirms it, and anything else - including
+        being offline - trusts the local copy, preserving the old
+        skip-if-exists behaviour.
+        """
+        meta = _load_json_sidecar(meta_path)
+        export_id = meta.get('export_id')
+        if export_id is None or not hasattr(self.client, 'session'):
+            return True
+
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
         try:
-            # Check if output directory exists
-            if os.path.exists(output_dir):
-                logger.info(f"Video directory already exists: {output_dir}. Skipping video download.")
-                # Return existing video files
-                existing_files = [f for f in os.listdir(output_dir) if f.endswith('.mp4')]
-                return True, existing_files
-            
-            # Create output directory
+            response = self.client.session.get(
+                f"{self.base_url}/api/projects/{self.project_id}/exports/{export_id}",
+                headers=headers, timeout=10
+            )
+        except Exception:
+            return True
+
+        if response.status_code == 404:
+            return False
+        if response.status_code == 200 and response.headers.get('ETag'):
+            meta['etag'] = response.headers['ETag']
+            _save_json_sidecar(meta_path, meta)
+        return True
+
+    async def _download_one(self, session: aiohttp.ClientSession, sem: asyncio.Semaphore,
+                            video_url: str, fallback_name: str, output_dir: str, manifest: dict,
+                            downloaded_files: List[str], failed_downloads: List[str]):
+        """Stream one video URL to disk."""
+        try:
+            # If it's a relative URL, make it absolute
+            if video_url.startswith('/'):
+                video_url = f"{self.base_url}{video_url}"
+
+            # Extract filename from the path (last component)
+            # e.g., "/data/upload/5/46763684-20250514_ride_bike_in_circles_part1.mp4" -> "46763684-20250514_ride_bike_in_circles_part1.mp4"
+            filename = os.path.basename(video_url)
+            if not filename.endswith('.mp4'):
+                filename = fallback_name
+
+            filepath = os.path.join(output_dir, filename)
+            headers = {'Authorization': f'Token {self.client.api_key}'}
+
+            # Skip existing files - but when we have a manifest entry,
+            # revalidate it against the server's ETag/length first so a
+            # re-uploaded video of the same name is picked up
+            if os.path.exists(filepath):
+                entry = manifest.get(filename)
+                if entry is None:
+                    logger.info(f"Video already exists, skipping: {filename}")
+                    downloaded_files.append(filename)
+                    return
+                async with session.head(video_url, headers=headers) as head:
+                    etag = head.headers.get('ETag')
+                    length = int(head.headers.get('Content-Length', -1))
+                    if (head.status == 200
+                            and entry.get('length') == length
+                            and entry.get('etag') in (None, etag)):
+                        logger.info(f"Video unchanged on server, skipping: {filename}")
+                        downloaded_files.append(filename)
+                        return
+                logger.info(f"Video changed on server, re-downloading: {filename}")
+
+            # Download the video file; disk writes go through the executor
+            # so a slow write never stalls the other transfers
+            loop = asyncio.get_running_loop()
+            async with sem:
+                # Large files: parallel Range requests sidestep the window
+                # limit of a single TCP stream. Falls through to the plain
+                # GET when the server doesn't support ranges.
+                if await self._download_ranges(session, headers, video_url, filepath):
+                    logger.info(f"Downloaded: {filename}")
+                    manifest[filename] = {'etag': None, 'length': os.path.getsize(filepath),
+                                          'mtime': os.path.getmtime(filepath)}
+                    downloaded_files.append(filename)
+                    return
+
+                async with session.get(video_url, headers=headers) as response:
+                    if response.status == 200:
+                        with open(filepath, 'wb') as f:
+                            async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                                await loop.run_in_executor(None, f.write, chunk)
+                        logger.info(f"Downloaded: {filename}")
+                        manifest[filename] = {'etag': response.headers.get('ETag'),
+                                              'length': os.path.getsize(filepath),
+                                              'mtime': os.path.getmtime(filepath)}
+                        downloaded_files.append(filename)
+                    else:
+                        logger.error(f"Failed to download {video_url}: HTTP {response.status}")
+                        failed_downloads.append(filename)
+
+        except Exception as e:
+            # Record the failure locally; raising would cancel the sibling
+            # downloads in the TaskGroup
+            logger.error(f"Error downloading video {video_url}: {e}")
+            failed_downloads.append(fallback_name)
+
+    async def _download_ranges(self, session: aiohttp.ClientSession, headers: dict,
+                               video_url: str, filepath: str) -> bool:
+        """
+        Download one large file as RANGE_PARTS parallel byte-range requests.
+
+        The file is pre-sized and each part os.pwrite()s at its own offset,
+        so no reassembly pass is needed. Returns False when the file is
+        small, the server doesn't accept ranges, or any part fails - the
+        caller then falls back to the single-stream path.
+        """
+        try:
+            async with session.head(video_url, headers=headers) as head:
+                if head.status != 200:
+                    return False
+                size = int(head.headers.get('Content-Length', 0))
+                if size < RANGE_MIN_SIZE or head.headers.get('Accept-Ranges', '').lower() != 'bytes':
+                    return False
+
+            loop = asyncio.get_running_loop()
+            fd = os.open(filepath, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o644)
+            try:
+                if hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(fd, 0, size)
+
+                part_size = -(-size // RANGE_PARTS)  # ceil division
+
+                async def _fetch_part(lo: int, hi: int):
+                    part_headers = dict(headers, Range=f'bytes={lo}-{hi}')
+                    async with session.get(video_url, headers=part_headers) as response:
+                        if response.status != 206:
+                            raise OSError(f"Range request returned HTTP {response.status}")
+                        offset = lo
+                        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                            await loop.run_in_executor(None, os.pwrite, fd, chunk, offset)
+                            offset += len(chunk)
+
+                async with asyncio.TaskGroup() as tg:
+                    for lo in range(0, size, part_size):
+                        tg.create_task(_fetch_part(lo, min(lo + part_size, size) - 1))
+            finally:
+                os.close(fd)
+            return True
+
+        except Exception as e:
+            logger.warning(f"Multi-part download failed for {video_url} ({e}), retrying single-stream")
+            return False
+
+    async def _download_videos_async(self, video_urls: List[str],
+                                     output_dir: str) -> Tuple[List[str], List[str]]:
+        """Download all video URLs concurrently, bounded by a semaphore."""
+        downloaded_files: List[str] = []
+        failed_downloads: List[str] = []
+
+        manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        manifest = _load_json_sidecar(manifest_path)
+
+        sem = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+        connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_DOWNLOADS)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            async with asyncio.TaskGroup() as tg:
+                for index, video_url in enumerate(video_urls):
+                    tg.create_task(self._download_one(
+                        session, sem, video_url, f"video_{index}.mp4",
+                        output_dir, manifest,
+                        downloaded_files, failed_downloads))
+
+        _save_json_sidecar(manifest_path, manifest)
+        return downloaded_files, failed_downloads
+
+    def download_videos_from_urls(self, video_urls: List[str],
+                                  output_dir: str = "exported_videos") -> Tuple[bool, List[str]]:
+        """Download the given video URLs into output_dir."""
+        try:
+            # Unlike the old directory-exists short-circuit, per-file
+            # manifest checks make reruns cheap while still fetching videos
+            # for tasks added since the last run
             os.makedirs(output_dir, exist_ok=True)
-            logger.info(f"Created video directory: {output_dir}")
-            
-            logger.info("Downloading videos from Label Studio...")
-            project = self.client.get_project(self.project_id)
-            tasks = project.get_tasks()
-            
-            downloaded_files = []
-            failed_downloads = []
-            
-            for task in tasks:
-                try:
-                    # Get the media file URL from task data
-                    if 'video' in task['data']:
-                        video_url = task['data']['video']
-                        
-                        # If it's a relative URL, make it absolute
-                        if video_url.startswith('/'):
-                            video_url = f"{self.base_url}{video_url}"
-                        
-                        # Extract filename from the path (last component)
-                        # e.g., "/data/upload/5/46763684-20250514_ride_bike_in_circles_part1.mp4" -> "46763684-20250514_ride_bike_in_circles_part1.mp4"
-                        filename = os.path.basename(video_url)
-                        if not filename.endswith('.mp4'):
-                            filename = f"task_{task['id']}.mp4"
-                        
-                        filepath = os.path.join(output_dir, filename)
-                        
-                        # Skip if file already exists
-                        if os.path.exists(filepath):
-                            logger.info(f"Video already exists, skipping: {filename}")
-                            downloaded_files.append(filename)
-                            continue
-                        
-                        # Download the video file
-                        headers = {'Authorization': f'Token {self.client.api_key}'}
-                        response = requests.get(video_url, headers=headers, stream=True)
-                        
-                        if response.status_code == 200:
-                            with open(filepath, 'wb') as f:
-                                for chunk in response.iter_content(chunk_size=8192):
-                                    f.write(chunk)
-                            logger.info(f"Downloaded: {filename}")
-                            downloaded_files.append(filename)
-                        else:
-                            error_msg = f"Failed to download {video_url}: HTTP {response.status_code}"
-                            logger.error(error_msg)
-                            failed_downloads.append(filename)
-                            
-                except Exception as e:
-                    error_msg = f"Error downloading video for task {task.get('id', 'unknown')}: {e}"
-                    logger.error(error_msg)
-                    failed_downloads.append(f"task_{task.get('id', 'unknown')}.mp4")
-            
+
+            # Downloads are network-bound, so run them concurrently instead
+            # of paying the sum of all transfer times
+            downloaded_files, failed_downloads = asyncio.run(
+                self._download_videos_async(video_urls, output_dir)
+            )
+
             if failed_downloads:
                 logger.warning(f"Failed to download {len(failed_downloads)} videos: {failed_downloads}")
-            
+
             logger.info(f"Successfully downloaded {len(downloaded_files)} videos")
             return len(downloaded_files) > 0, downloaded_files
-            
+
+        except Exception as e:
+            logger.error(f"Failed to download videos: {e}")
+            return False, []
+
+    def download_videos(self, output_dir: str = "exported_videos",
+                        annotations_file: Optional[str] = None) -> Tuple[bool, List[str]]:
+        """Download all videos from Label Studio project"""
+        try:
+            logger.info("Downloading videos from Label Studio...")
+
+            # The JSON_MIN export already carries every task's video URL in
+            # one payload; parsing it replaces the SDK's paginated
+            # get_tasks() round trips. Listing tasks remains the fallback
+            # when no export is on disk.
+            video_urls: List[str] = []
+            seen = set()
+            if annotations_file and os.path.exists(annotations_file):
+                with open(annotations_file) as f:
+                    items = json.load(f)
+                candidates = (item.get('video') for item in items)
+            else:
+                project = self.client.get_project(self.project_id)
+                candidates = (task['data'].get('video') for task in project.get_tasks())
+
+            for video_url in candidates:
+                if video_url and video_url not in seen:
+                    seen.add(video_url)
+                    video_urls.append(video_url)
+
+            return self.download_videos_from_urls(video_urls, output_dir)
+
         except Exception as e:
             logger.error(f"Failed to download videos: {e}")
             return False, []
@@ -140,8 +366,9 @@ class LabelStudioDownloader:
             logger.error("Failed to download annotations. Aborting.")
             return False, None, []
         
-        # Download videos
-        videos_success, video_files = self.download_videos(video_dir)
+        # Download videos, listing them from the export just written rather
+        # than re-paginating tasks over REST
+        videos_success, video_files = self.download_videos(video_dir, annotations_file=annotations_file)
         if not videos_success:
             logger.warning("Video download failed, but continuing with annotations only.")
         
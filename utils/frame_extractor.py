@@ -2,17 +2,458 @@
 Frame extraction utility using OpenCV.
 """
 
+import os
+
+# OpenCV's FFmpeg backend decodes single-threaded by default; let it use all
+# cores for frame/slice threading on H.264/H.265 streams. Must be set before
+# the first VideoCapture is created, and setdefault keeps a user override.
+os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", f"threads;{os.cpu_count()}")
+
 import cv2
+import gc
+import shutil
+import subprocess
 import numpy as np
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional, Dict, List
+from typing import Iterator, Optional, Dict, List, Tuple
+
+
+def _capture_open_params() -> List[int]:
+    """
+    Extra VideoCapture open params: FFmpeg hardware decode when opted in.
+
+    With USE_HWACCEL set, captures ask FFmpeg for any available hw decoder
+    (NVDEC, VAAPI, D3D11, ...) via VIDEO_ACCELERATION_ANY, which falls back
+    to software decode on its own when no device or codec support exists.
+    """
+    if os.environ.get("USE_HWACCEL", "0").lower() in ("0", "", "false"):
+        return []
+    return [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+
+
+def _nvdec_available() -> bool:
+    """True when OpenCV was built with cudacodec and a CUDA device exists."""
+    try:
+        return (hasattr(cv2, 'cudacodec')
+                and cv2.cuda.getCudaEnabledDeviceCount() > 0)
+    except Exception:
+        return False
+
+
+def _extract_one_video(video_path: Path, frame_numbers: List[int]):
+    """
+    Worker: extract one video's frames with strictly single-threaded decode.
+
+    Runs in its own process (top-level so it can be pickled); with one video
+    per core, FFmpeg's internal threads and cv2's would only fight each
+    other, so both are pinned to 1.
+    """
+    os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "threads;1"
+    cv2.setNumThreads(1)
+
+    extractor = FrameExtractor()
+    try:
+        return video_path, dict(extractor.iter_requested_frames(video_path, frame_numbers))
+    finally:
+        extractor.close_all()
 
 
 class FrameExtractor:
-    def __init__(self):
-        """Initialize frame extractor."""
-        self._video_cache = {}  # Cache for opened video captures
+    # When the next requested frame is further away than this, jump with a
+    # container seek (which lands on the preceding keyframe and decodes
+    # forward) instead of grab()-walking every intermediate frame. The value
+    # is above common GOP sizes so dense requests still stream sequentially.
+    SEEK_GAP_THRESHOLD = 300
+
+    # VideoCapture instances hold tens of MB that are not fully returned on
+    # release(), so keep only a few alive at a time
+    MAX_CACHED_CAPTURES = 4
+
+    # Interval-parallel decoding materializes at most roughly this many
+    # frames at once (~3 GB at 1080p); larger requests are split into more,
+    # smaller intervals that are submitted as earlier ones are consumed
+    MAX_BATCH_FRAMES = 500
+
+    def __init__(self, use_gpu: Optional[bool] = None):
+        """
+        Initialize frame extractor.
+
+        Args:
+            use_gpu: Decode on the GPU's NVDEC engine via cv2.cudacodec when
+                a CUDA device is present. Defaults to the USE_NVDEC env var;
+                silently falls back to CPU decode when unavailable
+        """
+        if use_gpu is None:
+            use_gpu = os.environ.get("USE_NVDEC", "0").lower() not in ("0", "", "false")
+        self._use_gpu = use_gpu and _nvdec_available()
+        self._capture_cache: "OrderedDict[Path, cv2.VideoCapture]" = OrderedDict()
+        self._keyframe_cache: Dict[Path, Optional[np.ndarray]] = {}
+        self._frame_buf: Optional[np.ndarray] = None  # reusable decode target
+
+    def _get_cap(self, video_path: Path) -> cv2.VideoCapture:
+        """
+        Return a pooled VideoCapture for the video, opening it if needed.
+
+        The pool is LRU-bounded: evicted captures are released explicitly and
+        a gc pass reclaims their buffers so long multi-video runs don't
+        accumulate leaked decoder allocations.
+        """
+        cap = self._capture_cache.get(video_path)
+        if cap is not None:
+            self._capture_cache.move_to_end(video_path)
+            return cap
+
+        cap = cv2.VideoCapture(str(video_path), cv2.CAP_ANY, _capture_open_params())
+        self._capture_cache[video_path] = cap
+
+        if len(self._capture_cache) > self.MAX_CACHED_CAPTURES:
+            _, evicted = self._capture_cache.popitem(last=False)
+            evicted.release()
+            gc.collect()
+
+        return cap
+
+    def _get_keyframes(self, video_path: Path) -> Optional[np.ndarray]:
+        """
+        Sorted 0-based keyframe positions for the video, or None when unknown.
+
+        Probed once with ffprobe from packet flags (no decoding involved) and
+        persisted next to the video as <name>.idx.npy, so later runs and
+        other worker processes skip the probe entirely. Returns None when
+        ffprobe is unavailable - callers then fall back to the fixed
+        SEEK_GAP_THRESHOLD heuristic.
+        """
+        if video_path in self._keyframe_cache:
+            return self._keyframe_cache[video_path]
+
+        keyframes = None
+        index_path = video_path.with_suffix('.idx.npy')
+        try:
+            if index_path.exists():
+                keyframes = np.load(index_path)
+            elif shutil.which('ffprobe'):
+                out = subprocess.run(
+                    ['ffprobe', '-loglevel', 'error', '-select_streams', 'v:0',
+                     '-show_entries', 'packet=flags', '-of', 'csv=p=0', str(video_path)],
+                    capture_output=True, text=True, check=True
+                ).stdout
+                keyframes = np.array(
+                    [i for i, flags in enumerate(out.split()) if 'K' in flags],
+                    dtype=np.int64
+                )
+                np.save(index_path, keyframes)
+        except (OSError, subprocess.SubprocessError, ValueError):
+            keyframes = None
+
+        if keyframes is not None and len(keyframes) == 0:
+            keyframes = None
+        self._keyframe_cache[video_path] = keyframes
+        return keyframes
+
+    def _should_seek(self, keyframes: Optional[np.ndarray], position: int, frame_number: int) -> bool:
+        """
+        Decide whether seeking to frame_number beats grab()-walking to it.
+
+        With a keyframe index the answer is exact: a container seek lands on
+        the keyframe preceding the target, so it only pays off when that
+        keyframe lies ahead of the current position. Without an index, fall
+        back to the fixed gap threshold.
+        """
+        if frame_number <= position:
+            return True
+        if keyframes is not None:
+            idx = int(np.searchsorted(keyframes, frame_number - 1, side='right')) - 1
+            return idx >= 0 and int(keyframes[idx]) > position
+        return frame_number - position > self.SEEK_GAP_THRESHOLD
+
+    def close_all(self):
+        """Release every pooled capture."""
+        while self._capture_cache:
+            _, cap = self._capture_cache.popitem(last=False)
+            cap.release()
+        gc.collect()
     
+    def iter_requested_frames(self, video_path: Path, frame_numbers: List[int],
+                              reuse_buffer: bool = False,
+                              block: Optional[np.ndarray] = None) -> Iterator[Tuple[int, Optional[np.ndarray]]]:
+        """
+        Yield requested frames in a single forward pass over the video.
+
+        Uses grab() to skip past unrequested frames (no decode) and calls
+        retrieve() only for the frames we actually need, so peak memory is
+        one frame instead of a whole batch.
+
+        Args:
+            video_path: Path to the video file
+            frame_numbers: Frame numbers to extract (1-indexed)
+            reuse_buffer: Decode every frame into one preallocated array
+                instead of a fresh ndarray per frame (~6 MB/frame at 1080p).
+                The yielded array is then invalidated by the next iteration,
+                so callers must consume (or copy) it before advancing
+            block: Optional preallocated (K, H, W, 3) uint8 array, K at least
+                the number of distinct frames requested. Frames decode into
+                its rows and the yielded arrays are views of it - one
+                allocation per batch instead of one per frame
+
+        Yields:
+            (frame_number, frame) tuples in ascending frame order; the frame
+            is None when it could not be read
+        """
+        if not frame_numbers:
+            return
+
+        if self._use_gpu:
+            try:
+                reader = cv2.cudacodec.createVideoReader(str(video_path))
+            except cv2.error as e:
+                # NVDEC rejects some codecs/profiles; the CPU path below
+                # handles anything FFmpeg can open
+                print(f"⚠️  NVDEC cannot decode {video_path.name} ({e}), using CPU decode")
+            else:
+                yield from self._iter_frames_nvdec(reader, video_path, sorted(set(frame_numbers)))
+                return
+
+        cap = self._get_cap(video_path)
+
+        if not cap.isOpened():
+            print(f"❌ Error: Cannot open video file {video_path}")
+            for frame_number in sorted(set(frame_numbers)):
+                yield frame_number, None
+            return
+
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        # A pooled capture may already sit mid-stream from a previous request
+        position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+        keyframes = self._get_keyframes(video_path)
+
+        if reuse_buffer:
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            if self._frame_buf is None or self._frame_buf.shape[:2] != (height, width):
+                self._frame_buf = np.empty((height, width, 3), dtype=np.uint8)
+
+        for block_index, frame_number in enumerate(sorted(set(frame_numbers))):
+            # Validate frame number
+            if frame_number < 1 or frame_number > total_frames:
+                print(f"⚠️  Frame {frame_number} out of range for {video_path.name} (total: {total_frames})")
+                yield frame_number, None
+                continue
+
+            # Seek when the target is behind us, or when the seek would land
+            # on a keyframe past our current position (gap heuristic when no
+            # keyframe index is available)
+            if self._should_seek(keyframes, position, frame_number):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number - 1)
+                position = frame_number - 1
+
+            # Advance to the requested frame without decoding skipped ones
+            failed = False
+            while position < frame_number:
+                if not cap.grab():
+                    print(f"❌ Error: Cannot read frame {frame_number} from {video_path.name}")
+                    failed = True
+                    break
+                position += 1
+
+            if failed:
+                yield frame_number, None
+                continue
+
+            if block is not None:
+                ret, frame = cap.retrieve(block[block_index])
+            elif reuse_buffer:
+                ret, frame = cap.retrieve(self._frame_buf)
+            else:
+                ret, frame = cap.retrieve()
+            if not ret:
+                print(f"❌ Error: Cannot read frame {frame_number} from {video_path.name}")
+                yield frame_number, None
+            else:
+                yield frame_number, frame
+
+    def _iter_frames_nvdec(self, reader, video_path: Path,
+                           wanted: List[int]) -> Iterator[Tuple[int, Optional[np.ndarray]]]:
+        """
+        Yield requested frames decoded on the GPU's NVDEC engine.
+
+        cudacodec readers only move forward, so the stream is decoded
+        sequentially and only the requested frames are downloaded to host
+        memory (with a GPU-side BGRA->BGR conversion). NVDEC decodes far
+        faster than realtime, so walking unrequested frames is cheaper than
+        it sounds and keeps the CPU free for JPEG encoding.
+        """
+        position = 0
+        failed = False
+        for frame_number in wanted:
+            if failed:
+                yield frame_number, None
+                continue
+
+            gpu_frame = None
+            while position < frame_number:
+                ret, gpu_frame = reader.nextFrame()
+                if not ret:
+                    print(f"❌ Error: Cannot read frame {frame_number} from {video_path.name}")
+                    failed = True
+                    break
+                position += 1
+
+            if failed or gpu_frame is None:
+                yield frame_number, None
+                continue
+
+            if gpu_frame.channels() == 4:
+                gpu_frame = cv2.cuda.cvtColor(gpu_frame, cv2.COLOR_BGRA2BGR)
+            yield frame_number, gpu_frame.download()
+
+    def iter_frames_parallel_intervals(self, video_path: Path, frame_numbers: List[int],
+                                       workers: Optional[int] = None) -> Iterator[Tuple[int, Optional[np.ndarray]]]:
+        """
+        Yield requested frames decoded by parallel interval workers.
+
+        The requested frames are split into contiguous intervals, one per
+        worker. Each worker opens its own capture, seeks once to the start of
+        its interval (OpenCV lands on the preceding keyframe and rolls
+        forward), then decodes forward - so the per-frame seek cost is paid
+        once per interval instead of once per frame, and intervals decode on
+        separate cores since FFmpeg releases the GIL.
+
+        Args:
+            video_path: Path to the video file
+            frame_numbers: Frame numbers to extract (1-indexed)
+            workers: Interval count (defaults to the CPU count)
+
+        Yields:
+            (frame_number, frame) tuples, grouped by interval; at most about
+            MAX_BATCH_FRAMES frames are held in memory at once regardless of
+            request size
+        """
+        wanted = sorted(set(frame_numbers))
+        if not wanted:
+            return
+
+        # A GPU has only a couple of NVDEC engines; interval threads would
+        # just queue behind them, so decode the whole request on one reader
+        if self._use_gpu:
+            yield from self.iter_requested_frames(video_path, wanted)
+            return
+
+        workers = min(workers or os.cpu_count() or 1, len(wanted))
+        if workers <= 1:
+            yield from self.iter_requested_frames(video_path, wanted)
+            return
+
+        # Cap interval length so the in-flight window (one interval per
+        # worker plus the one being yielded) stays within MAX_BATCH_FRAMES
+        chunk_size = min(-(-len(wanted) // workers),  # ceil division
+                         max(1, self.MAX_BATCH_FRAMES // (workers + 1)))
+        intervals = [wanted[i:i + chunk_size] for i in range(0, len(wanted), chunk_size)]
+        keyframes = self._get_keyframes(video_path)
+
+        def _decode_interval(interval: List[int]) -> Dict[int, Optional[np.ndarray]]:
+            # Deliberately not pooled: each worker thread needs its own
+            # decoder state, and interval captures are short-lived
+            cap = cv2.VideoCapture(str(video_path), cv2.CAP_ANY, _capture_open_params())
+            if not cap.isOpened():
+                print(f"❌ Error: Cannot open video file {video_path}")
+                return {frame_number: None for frame_number in interval}
+
+            results = {}
+            try:
+                total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+                # Single seek per interval; everything after is forward decode
+                cap.set(cv2.CAP_PROP_POS_FRAMES, interval[0] - 1)
+                position = interval[0] - 1
+
+                for frame_number in interval:
+                    if frame_number < 1 or frame_number > total_frames:
+                        print(f"⚠️  Frame {frame_number} out of range for {video_path.name} (total: {total_frames})")
+                        results[frame_number] = None
+                        continue
+
+                    # Seek across large gaps rather than grab()-walking them
+                    if frame_number > position and self._should_seek(keyframes, position, frame_number):
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number - 1)
+                        position = frame_number - 1
+
+                    failed = False
+                    while position < frame_number:
+                        if not cap.grab():
+                            failed = True
+                            break
+                        position += 1
+
+                    if failed:
+                        print(f"❌ Error: Cannot read frame {frame_number} from {video_path.name}")
+                        results[frame_number] = None
+                        continue
+
+                    ret, frame = cap.retrieve()
+                    results[frame_number] = frame if ret else None
+            finally:
+                cap.release()
+            return results
+
+        # Sliding submission window: only `workers` intervals are decoding
+        # (or decoded and waiting) at any time, so peak memory is bounded by
+        # the window instead of the whole request materializing at once
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque(pool.submit(_decode_interval, interval)
+                            for interval in intervals[:workers])
+            next_index = workers
+            while pending:
+                results = pending.popleft().result()
+                # Refill before yielding so workers stay busy while the
+                # consumer processes this interval
+                if next_index < len(intervals):
+                    pending.append(pool.submit(_decode_interval, intervals[next_index]))
+                    next_index += 1
+                yield from results.items()
+
+    def extract_frames_parallel_intervals(self, video_path: Path, frame_numbers: List[int],
+                                          workers: Optional[int] = None) -> Dict[int, Optional[np.ndarray]]:
+        """
+        Extract requested frames with interval-parallel decoding.
+
+        Dict-returning convenience wrapper around iter_frames_parallel_intervals.
+        """
+        return dict(self.iter_frames_parallel_intervals(video_path, frame_numbers, workers))
+
+    def extract_many(self, video_to_frames: Dict[Path, List[int]],
+                     workers: Optional[int] = None) -> Dict[Path, Dict[int, Optional[np.ndarray]]]:
+        """
+        Extract frames from many videos, one worker process per video.
+
+        Each worker decodes its video single-threaded (sequential grab walk),
+        so the batch scales with core count instead of oversubscribing the
+        decoder threads.
+
+        Args:
+            video_to_frames: Mapping of video path to requested frame numbers
+            workers: Process count (defaults to the CPU count)
+
+        Returns:
+            Mapping of video path to that video's frame-number -> frame dict
+        """
+        if not video_to_frames:
+            return {}
+
+        workers = min(workers or os.cpu_count() or 1, len(video_to_frames))
+        results: Dict[Path, Dict[int, Optional[np.ndarray]]] = {}
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_extract_one_video, video_path, frame_numbers)
+                for video_path, frame_numbers in video_to_frames.items()
+            ]
+            for future in as_completed(futures):
+                video_path, frames = future.result()
+                results[video_path] = frames
+
+        return results
+
     def extract_frames_batch(self, video_path: Path, frame_numbers: List[int]) -> Dict[int, Optional[np.ndarray]]:
         """
         Extract multiple frames from a video file efficiently.
@@ -24,48 +465,27 @@ class FrameExtractor:
         Returns:
             Dictionary mapping frame numbers to extracted frames
         """
-        results = {}
-        
         if not frame_numbers:
-            return results
-        
+            return {}
+
+        # iter_requested_frames walks the video forward once with grab()
+        # (no decode/color-convert on skipped frames) and retrieves only the
+        # requested ones, seeking only across gaps above SEEK_GAP_THRESHOLD.
+        # The old per-frame CAP_PROP_POS_FRAMES seek re-decoded from the
+        # preceding keyframe for every single request.
         try:
-            # Open video file once
-            cap = cv2.VideoCapture(str(video_path))
-            
-            if not cap.isOpened():
-                print(f"❌ Error: Cannot open video file {video_path}")
-                return {fn: None for fn in frame_numbers}
-            
-            # Get video properties
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            
-            # Sort frame numbers for efficient sequential access
-            sorted_frames = sorted(frame_numbers)
-            
-            # Extract frames sequentially
-            for frame_number in sorted_frames:
-                # Validate frame number
-                if frame_number < 1 or frame_number > total_frames:
-                    print(f"⚠️  Frame {frame_number} out of range for {video_path.name} (total: {total_frames})")
-                    results[frame_number] = None
-                    continue
-                
-                # Set frame position (convert to 0-indexed)
-                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number - 1)
-                
-                # Read the frame
-                ret, frame = cap.read()
-                
-                if not ret:
-                    print(f"❌ Error: Cannot read frame {frame_number} from {video_path.name}")
-                    results[frame_number] = None
-                else:
-                    results[frame_number] = frame
-            
-            cap.release()
-            return results
-            
+            # One block allocation for the whole batch; the returned frames
+            # are views into it, so the allocator sees a single request
+            # instead of one ~6 MB malloc per frame
+            block = None
+            if not self._use_gpu:
+                cap = self._get_cap(video_path)
+                height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                if height > 0 and width > 0:
+                    block = np.empty((len(set(frame_numbers)), height, width, 3), dtype=np.uint8)
+
+            return dict(self.iter_requested_frames(video_path, frame_numbers, block=block))
         except Exception as e:
             print(f"❌ Error extracting frames from {video_path}: {e}")
             return {fn: None for fn in frame_numbers}
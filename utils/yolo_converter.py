@@ -2,9 +2,42 @@
 YOLO format converter.
 """
 
+import logging
+import numpy as np
+import operator
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple
-import yaml
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .annotations import Annotations
+
+logger = logging.getLogger(__name__)
+
+# Optional: Numba JIT-compiles the bbox conversion into one fused,
+# SIMD-vectorized pass over the rows; cache=True persists the compiled
+# kernel so later runs skip compilation entirely
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _yolo_convert_inplace(xywh):
+        """Rescale percent boxes to clipped YOLO center format, in place."""
+        for i in prange(xywh.shape[0]):
+            w = xywh[i, 2] * 0.01
+            h = xywh[i, 3] * 0.01
+            cx = xywh[i, 0] * 0.01 + 0.5 * w
+            cy = xywh[i, 1] * 0.01 + 0.5 * h
+            xywh[i, 0] = min(1.0, max(0.0, cx))
+            xywh[i, 1] = min(1.0, max(0.0, cy))
+            xywh[i, 2] = min(1.0, max(0.0, w))
+            xywh[i, 3] = min(1.0, max(0.0, h))
+else:
+    _yolo_convert_inplace = None
 
 
 class YOLOConverter:
@@ -13,74 +46,200 @@ class YOLOConverter:
         Initialize YOLO converter.
         
         Args:
-            class_mappings: Dictionary mapping class names to their integer encodings
+            class_mappings: Dictionary mapping class names to their integer encodings;
+                treated as immutable after construction
         """
         self.class_mappings = class_mappings
+        # Class names ordered by id, computed once - every writer needs this
+        # list and re-sorting per call adds up when emitting per-split files
+        self._sorted_class_names = [
+            name for name, _ in sorted(class_mappings.items(), key=operator.itemgetter(1))
+        ]
     
-    def _convert_bbox_to_yolo(self, x: float, y: float, width: float, height: float, 
-                             img_width: int, img_height: int) -> Tuple[float, float, float, float]:
+    def _convert_bbox_to_yolo(self, x: float, y: float, width: float,
+                             height: float) -> Tuple[float, float, float, float]:
         """
         Convert bounding box from percentage coordinates to YOLO format.
-        
+
+        Scalar reference for _convert_bboxes_to_yolo_batch. The conversion is
+        a pure percentage rescale, so no image dimensions are needed.
+
         Args:
             x, y, width, height: Bounding box in percentage (0-100)
-            img_width, img_height: Image dimensions in pixels
-            
+
         Returns:
             Tuple of (center_x, center_y, width, height) in normalized coordinates (0-1)
         """
-        # Convert percentages to normalized coordinates (0-1)
-        x_norm = x / 100.0
-        y_norm = y / 100.0
-        width_norm = width / 100.0
-        height_norm = height / 100.0
-        
-        # Convert to YOLO format (center coordinates)
-        center_x = x_norm + (width_norm / 2.0)
-        center_y = y_norm + (height_norm / 2.0)
-        
-        # Ensure coordinates are within bounds
-        center_x = max(0.0, min(1.0, center_x))
-        center_y = max(0.0, min(1.0, center_y))
-        width_norm = max(0.0, min(1.0, width_norm))
-        height_norm = max(0.0, min(1.0, height_norm))
-        
-        return center_x, center_y, width_norm, height_norm
+        # Normalize, shift to center coordinates and clip in four fused
+        # expressions - fewer locals means fewer store/load bytecodes per
+        # box, and multiplying by constants avoids the slower divisions
+        cx = (x + width * 0.5) * 0.01
+        cy = (y + height * 0.5) * 0.01
+        w = width * 0.01
+        h = height * 0.01
+        return (
+            0.0 if cx < 0.0 else (1.0 if cx > 1.0 else cx),
+            0.0 if cy < 0.0 else (1.0 if cy > 1.0 else cy),
+            0.0 if w < 0.0 else (1.0 if w > 1.0 else w),
+            0.0 if h < 0.0 else (1.0 if h > 1.0 else h),
+        )
     
-    def create_yolo_annotation(self, annotations: List[Dict], image_shape: Tuple[int, int, int], 
+    def _convert_bboxes_to_yolo_batch(self, xywh_percent: np.ndarray) -> np.ndarray:
+        """
+        Vectorized _convert_bbox_to_yolo for all boxes of one image.
+
+        One fused NumPy pass replaces the per-box scalar divisions and
+        min/max clips, whose interpreter overhead dominates on frames with
+        many boxes. Uses the Numba kernel when available.
+
+        Args:
+            xywh_percent: (N, 4) array of boxes in percentage coordinates
+
+        Returns:
+            (N, 4) array of (center_x, center_y, width, height) normalized
+            to 0-1
+        """
+        if _yolo_convert_inplace is not None:
+            boxes = np.ascontiguousarray(xywh_percent, dtype=np.float32)
+            if boxes is xywh_percent:
+                boxes = boxes.copy()
+            _yolo_convert_inplace(boxes)
+            return boxes
+
+        boxes = xywh_percent.astype(np.float32) * 0.01
+        boxes[:, 0] += boxes[:, 2] * 0.5
+        boxes[:, 1] += boxes[:, 3] * 0.5
+        np.clip(boxes, 0.0, 1.0, out=boxes)
+        return boxes
+
+    def format_yolo_annotation(self, annotations: List[Dict],
+                               image_shape: Optional[Tuple[int, int, int]] = None) -> str:
+        """
+        Format the YOLO annotation lines for a single image.
+
+        Kept separate from the file write so callers can batch/buffer the
+        writes instead of paying an open/write/close syscall triple per frame
+        on the hot path.
+
+        Args:
+            annotations: List of annotation dictionaries for the image
+            image_shape: Accepted for compatibility and ignored - the boxes
+                are percentages, so the math never needs pixel dimensions
+
+        Returns:
+            Annotation file content as a single string
+        """
+        boxes = Annotations.from_dicts(annotations)
+        return self.format_yolo_annotation_arrays(boxes.class_ids, boxes.xywh)
+
+    def format_yolo_annotation_arrays(self, class_ids: np.ndarray, xywh_percent: np.ndarray,
+                                      image_shape: Optional[Tuple[int, int, int]] = None) -> str:
+        """
+        Format YOLO annotation lines from structure-of-arrays box storage.
+
+        Array-native counterpart of format_yolo_annotation; the processor
+        stores boxes as (class_ids, xywh) arrays so this skips the per-box
+        dict round trip.
+
+        Args:
+            class_ids: (N,) array of class ids
+            xywh_percent: (N, 4) array of boxes in percentage coordinates
+            image_shape: Accepted for compatibility and ignored - the boxes
+                are percentages, so the math never needs pixel dimensions
+
+        Returns:
+            Annotation file content as a single string
+        """
+        payload = self.format_yolo_annotation_payload(class_ids, xywh_percent)
+        return payload[:-1].decode('ascii') if payload else ''
+
+    # Per-line byte template; every label line has the same fixed shape
+    _LINE_TEMPLATE = b"%d %.6f %.6f %.6f %.6f\n"
+
+    def format_yolo_annotation_payload(self, class_ids: np.ndarray,
+                                       xywh_percent: np.ndarray) -> bytes:
+        """
+        Format YOLO annotation lines as a ready-to-write bytes buffer.
+
+        The line shape is fixed, so repeating the template N times and
+        interpolating every value in one C-level %-call formats the whole
+        file at once - no per-row loop, no intermediate strings, no
+        str-then-encode round trip.
+
+        Args:
+            class_ids: (N,) array of class ids
+            xywh_percent: (N, 4) array of boxes in percentage coordinates
+
+        Returns:
+            Newline-terminated annotation lines as bytes
+        """
+        boxes = self._convert_bboxes_to_yolo_batch(xywh_percent)
+
+        # Interleave (class_id, cx, cy, w, h) rows into one flat value tuple;
+        # %d truncates the float class ids back to integers
+        flat = np.empty((len(boxes), 5), dtype=np.float64)
+        flat[:, 0] = class_ids
+        flat[:, 1:] = boxes
+        return (self._LINE_TEMPLATE * len(boxes)) % tuple(flat.ravel().tolist())
+
+    def create_yolo_annotation(self, annotations: List[Dict],
+                              image_shape: Optional[Tuple[int, int, int]],
                               output_path: Path):
         """
         Create a YOLO annotation file for a single image.
-        
+
         Args:
             annotations: List of annotation dictionaries for the image
-            image_shape: Shape of the image (height, width, channels)
+            image_shape: Accepted for compatibility and ignored; callers no
+                longer need to decode the image (or even read its header)
+                just to label it
             output_path: Path where to save the annotation file
         """
-        img_height, img_width = image_shape[:2]
-        
-        yolo_lines = []
-        
-        for annotation in annotations:
-            class_id = annotation['class_id']
-            x = annotation['x']
-            y = annotation['y']
-            width = annotation['width']
-            height = annotation['height']
-            
-            # Convert to YOLO format
-            center_x, center_y, norm_width, norm_height = self._convert_bbox_to_yolo(
-                x, y, width, height, img_width, img_height
-            )
-            
-            # Create YOLO format line: class_id center_x center_y width height
-            yolo_line = f"{class_id} {center_x:.6f} {center_y:.6f} {norm_width:.6f} {norm_height:.6f}"
-            yolo_lines.append(yolo_line)
-        
-        # Write annotation file
-        with open(output_path, 'w') as f:
-            f.write('\n'.join(yolo_lines))
+        boxes = Annotations.from_dicts(annotations)
+        payload = self.format_yolo_annotation_payload(boxes.class_ids, boxes.xywh)
+        # Raw open/write/close: one syscall triple per file, no io wrapper
+        fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, payload)
+        finally:
+            os.close(fd)
+
+    def create_yolo_annotations_many(self, items: Iterable[Tuple[List[Dict], Path]],
+                                     n_workers: Optional[int] = None):
+        """
+        Write many annotation files in parallel.
+
+        Each file is small and independent: the formatting is C-bound NumPy
+        and the write releases the GIL, so threads scale well without the
+        pickling cost a process pool would add.
+
+        Args:
+            items: (annotations, output_path) pairs, one per image
+            n_workers: Thread count; defaults to the CPU count
+        """
+        def _write_one(item):
+            annotations, output_path = item
+            self.create_yolo_annotation(annotations, None, output_path)
+
+        with ThreadPoolExecutor(max_workers=n_workers or os.cpu_count()) as executor:
+            # chunksize batches queue hand-offs across many tiny tasks;
+            # draining the iterator surfaces any worker exception here
+            list(executor.map(_write_one, items, chunksize=64))
     
+    def write_yolo_metadata(self, out_dir: Path, dataset_name: str = "dataset"):
+        """
+        Write classes.txt and data.yaml into the dataset directory.
+
+        Both files come from the same cached, id-sorted class list, so one
+        call covers all per-dataset metadata without duplicated work.
+
+        Args:
+            out_dir: Dataset root directory
+            dataset_name: Name of the dataset
+        """
+        self.create_classes_file(out_dir / "classes.txt")
+        self.create_yaml_file(out_dir / "data.yaml", dataset_name)
+
     def create_classes_file(self, output_path: Path):
         """
         Create classes.txt file for YOLO format.
@@ -88,13 +247,8 @@ class YOLOConverter:
         Args:
             output_path: Path where to save the classes file
         """
-        # Sort classes by their ID
-        sorted_classes = sorted(self.class_mappings.items(), key=lambda x: x[1])
-        
-        class_lines = [class_name for class_name, _ in sorted_classes]
-        
         with open(output_path, 'w') as f:
-            f.write('\n'.join(class_lines))
+            f.write('\n'.join(self._sorted_class_names))
     
     def create_yaml_file(self, output_path: Path, dataset_name: str = "dataset"):
         """
@@ -104,25 +258,27 @@ class YOLOConverter:
             output_path: Path where to save the YAML file
             dataset_name: Name of the dataset
         """
-        # Sort classes by their ID to get the correct order
-        sorted_classes = sorted(self.class_mappings.items(), key=lambda x: x[1])
-        class_names = [class_name for class_name, _ in sorted_classes]
-        
-        # Create YAML content with relative paths
-        yaml_content = {
-            'path': '.',  # Relative to the YAML file location
-            'train': 'images',  # Since we're not splitting, put everything in train
-            'val': 'images',    # Use same directory for validation
-            'test': 'images',   # Use same directory for test
-            
-            'nc': len(self.class_mappings),  # Number of classes
-            'names': class_names  # Class names in order
-        }
-        
-        # Write YAML file
+        class_names = self._sorted_class_names
+
+        # The schema is fixed, so emit the YAML directly instead of paying
+        # yaml.dump's representer walk for a handful of lines. Paths are
+        # relative to the YAML file location; without a split, train/val/test
+        # all point at the same images directory
+        yaml_content = (
+            "path: .\n"
+            "train: images\n"
+            "val: images\n"
+            "test: images\n"
+            f"nc: {len(class_names)}\n"
+            "names:\n"
+            + ''.join(f"- {class_name}\n" for class_name in class_names)
+        )
+
         with open(output_path, 'w') as f:
-            yaml.dump(yaml_content, f, default_flow_style=False, sort_keys=False)
+            f.write(yaml_content)
         
-        print(f"📄 YAML config saved: {output_path}")
-        print(f"   - Classes: {len(class_names)}")
-        print(f"   - Names: {', '.join(class_names)}")
\ No newline at end of file
+        # Deferred %-formatting: nothing is built when the level filters
+        # the record, and the joined name list only exists under DEBUG
+        logger.info("YAML config saved: %s (classes=%d)", output_path, len(class_names))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Class names: %s", ', '.join(class_names))
\ No newline at end of file